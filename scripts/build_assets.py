@@ -7,17 +7,33 @@ from pathlib import Path
 import pandas as pd
 
 try:
-    from .common import DATA_ROOT, PROJECT_ROOT, load_indices
+    from .common import (
+        DATA_ROOT,
+        PERCENTILE_HORIZONS,
+        PERCENTILE_METRICS,
+        PROJECT_ROOT,
+        load_indices,
+        percentile_column,
+    )
 except ImportError:  # pragma: no cover - direct execution fallback
     import sys
 
     sys.path.append(str(Path(__file__).resolve().parent.parent))
-    from scripts.common import DATA_ROOT, PROJECT_ROOT, load_indices  # type: ignore
+    from scripts.common import (  # type: ignore
+        DATA_ROOT,
+        PERCENTILE_HORIZONS,
+        PERCENTILE_METRICS,
+        PROJECT_ROOT,
+        load_indices,
+        percentile_column,
+    )
 
 
 METRICS_PATH = DATA_ROOT / "processed" / "metrics.csv"
+QUALITY_FLAGS_PATH = DATA_ROOT / "processed" / "quality_flags.csv"
 DOCS_DIR = PROJECT_ROOT / "docs"
 TARGET_CSV = DOCS_DIR / "assets.csv"
+CLUSTERS_CSV = DOCS_DIR / "clusters.csv"
 
 
 def _format_etfs(cfg: dict[str, object]) -> str:
@@ -39,6 +55,24 @@ def _safe(value, default: float | None = None, digits: int = 4) -> float | None:
         return default
 
 
+def _load_quality_flags() -> dict[str, str]:
+    if not QUALITY_FLAGS_PATH.exists():
+        return {}
+    flags_df = pd.read_csv(QUALITY_FLAGS_PATH, dtype=str, keep_default_na=False)
+    if "index_code" not in flags_df.columns or "quality_flags" not in flags_df.columns:
+        return {}
+    return dict(zip(flags_df["index_code"], flags_df["quality_flags"]))
+
+
+def _load_clusters() -> dict[str, str]:
+    if not CLUSTERS_CSV.exists():
+        return {}
+    clusters_df = pd.read_csv(CLUSTERS_CSV, dtype=str, keep_default_na=False)
+    if "index_code" not in clusters_df.columns or "cluster" not in clusters_df.columns:
+        return {}
+    return dict(zip(clusters_df["index_code"], clusters_df["cluster"]))
+
+
 def main() -> None:
     if not METRICS_PATH.exists():
         raise SystemExit("缺少指标文件 metrics.csv，请先运行 compute_metrics.py")
@@ -47,12 +81,20 @@ def main() -> None:
     if "index_code" not in metrics_df.columns:
         raise SystemExit("指标文件缺少 index_code 列")
     metrics_df.set_index("index_code", inplace=True)
+    quality_flags = _load_quality_flags()
+    clusters = _load_clusters()
+
+    horizon_columns = [
+        percentile_column(metric, label) for metric in PERCENTILE_METRICS for label in PERCENTILE_HORIZONS
+    ]
 
     rows: list[dict[str, object]] = []
     for cfg in load_indices():
         code = cfg["code"]
         metrics = metrics_df.loc[code] if code in metrics_df.index else {}
 
+        horizon_pcts = {column: _safe(metrics.get(column), None, 2) for column in horizon_columns}
+
         rows.append(
             {
                 "index_name": cfg["name"],
@@ -62,10 +104,13 @@ def main() -> None:
                 "pe_pct": _safe(metrics.get("pe_pct"), 100.0, 2),
                 "pb": _safe(metrics.get("pb_current"), None, 2),
                 "pb_pct": _safe(metrics.get("pb_pct"), 100.0, 2),
+                **horizon_pcts,
                 "dividend": _safe(metrics.get("dividend_current"), None, 4),
                 "roe": _safe(metrics.get("roe_current"), None, 4),
                 "drawdown": _safe(metrics.get("drawdown"), 0.0, 4),
                 "eva_type": metrics.get("eva_type") if isinstance(metrics, pd.Series) else None,
+                "quality_flags": quality_flags.get(code, ""),
+                "cluster": clusters.get(code, ""),
             }
         )
 
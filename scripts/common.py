@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, List, Optional
 
 import yaml
 
@@ -12,6 +12,16 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 CONFIG_PATH = PROJECT_ROOT / "config" / "indices.yaml"
 DATA_ROOT = PROJECT_ROOT / "data"
 
+# Valuation percentile lookbacks (label -> years, None = full history)
+PERCENTILE_HORIZONS: Dict[str, Optional[int]] = {"3y": 3, "5y": 5, "10y": 10, "all": None}
+# Metrics that get one percentile column per horizon, e.g. pe_pct_5y
+PERCENTILE_METRICS = ("pe", "pb", "dividend")
+
+
+def percentile_column(metric: str, label: str) -> str:
+    """Column name for a metric's percentile over one horizon."""
+    return f"{metric}_pct_{label}"
+
 
 def load_indices() -> List[dict[str, Any]]:
     """Load the index configuration table."""
@@ -38,4 +48,13 @@ def ensure_workspace_dir(*segments: str) -> Path:
     return target
 
 
-__all__ = ["PROJECT_ROOT", "DATA_ROOT", "load_indices", "ensure_data_dir", "ensure_workspace_dir"]
+__all__ = [
+    "PROJECT_ROOT",
+    "DATA_ROOT",
+    "PERCENTILE_HORIZONS",
+    "PERCENTILE_METRICS",
+    "percentile_column",
+    "load_indices",
+    "ensure_data_dir",
+    "ensure_workspace_dir",
+]
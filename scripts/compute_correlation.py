@@ -0,0 +1,333 @@
+"""Maintain rolling cross-index return correlations and cluster the indices."""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, leaves_list, linkage
+from scipy.spatial.distance import squareform
+
+try:
+    from .common import DATA_ROOT, PROJECT_ROOT, ensure_data_dir, load_indices
+except ImportError:  # pragma: no cover - direct execution fallback
+    import sys
+
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from scripts.common import DATA_ROOT, PROJECT_ROOT, ensure_data_dir, load_indices  # type: ignore
+
+
+PRICE_DIRS = {
+    "CN_CSI": DATA_ROOT / "raw" / "cn_csi",
+    "HK_HSI": DATA_ROOT / "raw" / "hk_hsi",
+    "US_INDEX": DATA_ROOT / "raw" / "us_index",
+}
+
+PROCESSED_DIR = ensure_data_dir("processed")
+STATE_FILE = PROCESSED_DIR / "correlation_state.npz"
+DOCS_DIR = PROJECT_ROOT / "docs"
+CORRELATION_CSV = DOCS_DIR / "correlation.csv"
+NEIGHBORS_CSV = DOCS_DIR / "correlation_top.csv"
+CLUSTERS_CSV = DOCS_DIR / "clusters.csv"
+
+# 滚动窗口（合并后的交易日行数）与最少共同观测数
+CORRELATION_WINDOW = 250
+MIN_OBSERVATIONS = 60
+# 平均相关系数约 0.5 以上的指数归为同一簇：distance = sqrt((1 - rho) / 2)
+CLUSTER_DISTANCE = 0.5
+# 增量更新累计一定次数后全量重算，避免浮点误差漂移
+REBUILD_EVERY = 250
+# 最新日期落后超过该交易日数的序列不再阻塞增量截止日
+LAG_TOLERANCE_DAYS = 5
+BLOCK_SIZE = 512
+# 完整 N×N 矩阵只在指数较少时发布；始终发布每个指数相关性最高的邻居
+DENSE_MATRIX_MAX_INDICES = 200
+TOP_NEIGHBORS = 5
+
+STAT_KEYS = ("count", "sum", "sumsq", "cross")
+
+
+def _load_returns(indices: list[dict[str, object]]) -> pd.DataFrame:
+    """Daily log returns on the union of trading dates, one column per index."""
+    columns: Dict[str, pd.Series] = {}
+    for cfg in indices:
+        market = cfg.get("class")
+        if market not in PRICE_DIRS:
+            raise ValueError(f"未知市场分类: {market}")
+        code = str(cfg["code"])
+        path = PRICE_DIRS[market] / f"{code}_price.csv"
+        if not path.exists():
+            columns[code] = pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+            continue
+        df = pd.read_csv(path, parse_dates=["date"])
+        close = pd.to_numeric(df["close"], errors="coerce")
+        close = pd.Series(close.to_numpy(), index=df["date"]).dropna()
+        close = close[close > 0].sort_index()
+        close = close[~close.index.duplicated(keep="last")]
+        columns[code] = np.log(close).diff().dropna()
+    returns = pd.DataFrame(columns)
+    # 缺失或全空的序列不应把合并后的索引退化为 object
+    returns.index = pd.to_datetime(returns.index)
+    returns = returns.sort_index()
+    return returns.reindex(columns=[str(cfg["code"]) for cfg in indices])
+
+
+def _ingest_cutoff(returns: pd.DataFrame) -> Optional[pd.Timestamp]:
+    """Last date every live series has reported, so late markets are not skipped."""
+    last_dates = returns.apply(pd.Series.last_valid_index).dropna()
+    if last_dates.empty:
+        return None
+    latest = last_dates.max()
+    lag = np.busday_count(
+        last_dates.to_numpy(dtype="datetime64[D]"), np.datetime64(latest.date(), "D")
+    )
+    return last_dates[lag <= LAG_TOLERANCE_DAYS].min()
+
+
+def _blocked_gram(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Compute left.T @ right in column blocks to bound temporary memory."""
+    out = np.empty((left.shape[1], right.shape[1]))
+    for start in range(0, left.shape[1], BLOCK_SIZE):
+        stop = start + BLOCK_SIZE
+        out[start:stop] = left[:, start:stop].T @ right
+    return out
+
+
+def _sufficient_stats(returns: np.ndarray) -> Dict[str, np.ndarray]:
+    """Pairwise-complete sums over a block of days (rows) x indices (columns).
+
+    ``sum[i, j]`` and ``sumsq[i, j]`` cover index i on the days index j also
+    traded, so every pair keeps its own overlap despite holidays and gaps.
+    """
+    present = np.isfinite(returns).astype(float)
+    filled = np.where(present > 0, returns, 0.0)
+    return {
+        "count": _blocked_gram(present, present),
+        "sum": _blocked_gram(filled, present),
+        "sumsq": _blocked_gram(filled * filled, present),
+        "cross": _blocked_gram(filled, filled),
+    }
+
+
+def _correlation(stats: Dict[str, np.ndarray]) -> np.ndarray:
+    n = stats["count"]
+    sx = stats["sum"]
+    sxx = stats["sumsq"]
+    cov = n * stats["cross"] - sx * sx.T
+    var_x = n * sxx - sx * sx
+    var_y = var_x.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < MIN_OBSERVATIONS) | ~np.isfinite(corr)] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    diagonal = np.diag(n) >= MIN_OBSERVATIONS
+    corr[np.diag_indices_from(corr)] = np.where(diagonal, 1.0, np.nan)
+    return corr
+
+
+def _rebuild(returns: pd.DataFrame) -> dict[str, object]:
+    window = returns.iloc[-CORRELATION_WINDOW:]
+    return {
+        "codes": np.asarray(returns.columns, dtype=str),
+        "dates": window.index.to_numpy(dtype="datetime64[D]"),
+        "window": window.to_numpy(dtype=float),
+        "updates": 0,
+        **_sufficient_stats(window.to_numpy(dtype=float)),
+    }
+
+
+def _update(state: dict[str, object], new_rows: pd.DataFrame) -> dict[str, object]:
+    """Slide the window forward: add the new days, subtract the evicted ones."""
+    window = np.vstack([state["window"], new_rows.to_numpy(dtype=float)])
+    dates = np.concatenate([state["dates"], new_rows.index.to_numpy(dtype="datetime64[D]")])
+    evict = max(len(window) - CORRELATION_WINDOW, 0)
+
+    added = _sufficient_stats(new_rows.to_numpy(dtype=float))
+    removed = _sufficient_stats(window[:evict]) if evict else None
+    for key in STAT_KEYS:
+        state[key] = state[key] + added[key]
+        if removed is not None:
+            state[key] = state[key] - removed[key]
+
+    state["window"] = window[evict:]
+    state["dates"] = dates[evict:]
+    state["updates"] = int(state["updates"]) + 1
+    return state
+
+
+def _reconcile(state: dict[str, object], returns: pd.DataFrame) -> Optional[int]:
+    """Patch stored window days whose returns changed since they were ingested.
+
+    Backfilled lagging markets, revised history and source switches all show up
+    as differences against the freshly loaded returns; the stale rows' sums are
+    subtracted and the corrected ones added. Returns the number of revised days,
+    or None when the stored dates no longer line up and a rebuild is needed.
+    """
+    if not isinstance(returns.index, pd.DatetimeIndex):
+        return None
+    dates = pd.DatetimeIndex(state["dates"]).as_unit("ns")
+    index = returns.index.as_unit("ns")
+    fresh_dates = index[(index >= dates[0]) & (index <= dates[-1])]
+    if not fresh_dates.equals(dates):
+        return None
+
+    stored = state["window"]
+    fresh = returns.loc[dates].to_numpy(dtype=float)
+    changed = ~np.isclose(fresh, stored, rtol=0.0, atol=1e-12, equal_nan=True).all(axis=1)
+    if not changed.any():
+        return 0
+
+    removed = _sufficient_stats(stored[changed])
+    added = _sufficient_stats(fresh[changed])
+    for key in STAT_KEYS:
+        state[key] = state[key] - removed[key] + added[key]
+    window = stored.copy()
+    window[changed] = fresh[changed]
+    state["window"] = window
+    state["updates"] = int(state["updates"]) + 1
+    return int(changed.sum())
+
+
+def _load_state() -> Optional[dict[str, object]]:
+    if not STATE_FILE.exists():
+        return None
+    with np.load(STATE_FILE, allow_pickle=False) as payload:
+        return {key: payload[key] for key in payload.files}
+
+
+def _save_state(state: dict[str, object]) -> None:
+    np.savez_compressed(STATE_FILE, **{key: np.asarray(value) for key, value in state.items()})
+
+
+def _cluster(corr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Average-linkage clustering on sqrt((1 - rho) / 2); returns labels and leaf order."""
+    size = corr.shape[0]
+    if size < 2:
+        return np.ones(size, dtype=int), np.arange(size)
+    distance = np.sqrt(np.clip((1.0 - np.nan_to_num(corr, nan=-1.0)) / 2.0, 0.0, 1.0))
+    distance = (distance + distance.T) / 2.0
+    np.fill_diagonal(distance, 0.0)
+    tree = linkage(squareform(distance, checks=False), method="average")
+    labels = fcluster(tree, t=CLUSTER_DISTANCE, criterion="distance")
+    return labels, leaves_list(tree)
+
+
+def _stable_labels(labels: np.ndarray, has_data: np.ndarray) -> np.ndarray:
+    """Renumber clusters by their first member in indices.yaml order; 0 = no data.
+
+    fcluster numbers are arbitrary and reshuffle whenever the dendrogram moves,
+    so unchanged groups would otherwise get a new number every night.
+    """
+    stable = np.zeros(len(labels), dtype=int)
+    seen: Dict[int, int] = {}
+    for position in np.flatnonzero(has_data):
+        label = int(labels[position])
+        if label not in seen:
+            seen[label] = len(seen) + 1
+        stable[position] = seen[label]
+    return stable
+
+
+def _top_neighbors(corr: np.ndarray, codes: np.ndarray, k: int) -> pd.DataFrame:
+    """Highest-correlated peers of every index, k rows per index at most."""
+    k = min(k, len(codes) - 1)
+    if k <= 0:
+        return pd.DataFrame(columns=["index_code", "rank", "neighbor_code", "correlation"])
+    scores = np.where(np.isfinite(corr), corr, -np.inf)
+    np.fill_diagonal(scores, -np.inf)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    neighbors = pd.DataFrame(
+        {
+            "index_code": np.repeat(codes, k),
+            "rank": np.tile(np.arange(1, k + 1), len(codes)),
+            "neighbor_code": codes[top.ravel()],
+            "correlation": top_scores.ravel(),
+        }
+    )
+    neighbors = neighbors.loc[np.isfinite(neighbors["correlation"])]
+    return neighbors.round({"correlation": 4})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="滚动更新指数收益相关性与聚类")
+    parser.add_argument("--rebuild", action="store_true", help="忽略已保存的状态，全量重算")
+    args = parser.parse_args()
+
+    indices = load_indices()
+    returns = _load_returns(indices)
+    cutoff = _ingest_cutoff(returns)
+    if cutoff is None:
+        raise SystemExit("缺少行情数据，请先运行行情抓取脚本")
+    returns = returns.loc[:cutoff]
+
+    state = None if args.rebuild else _load_state()
+    codes = np.asarray(returns.columns, dtype=str)
+    if (
+        state is None
+        or not np.array_equal(state["codes"], codes)
+        or int(state["updates"]) >= REBUILD_EVERY
+        or len(state["dates"]) == 0
+    ):
+        state = _rebuild(returns)
+        print(f"[correlation] 全量重算 {len(codes)} 个指数，窗口 {len(state['dates'])} 天")
+    else:
+        revised = _reconcile(state, returns)
+        last_date = pd.Timestamp(state["dates"][-1])
+        new_rows = returns.loc[returns.index > last_date]
+        if revised is None:
+            state = _rebuild(returns)
+            print("[correlation] 历史日期与已保存窗口不一致，全量重算")
+        elif len(new_rows) >= CORRELATION_WINDOW:
+            state = _rebuild(returns)
+            print(f"[correlation] 新增 {len(new_rows)} 天超过窗口，全量重算")
+        else:
+            if revised:
+                print(f"[correlation] 修订窗口内 {revised} 天的历史收益")
+            if not new_rows.empty:
+                state = _update(state, new_rows)
+                print(f"[correlation] 增量更新 {len(new_rows)} 天")
+            elif not revised:
+                print("[correlation] 无新增交易日，沿用已有统计量")
+    _save_state(state)
+
+    corr = _correlation(state)
+    labels, order = _cluster(corr)
+    # 无足够行情的指数不归入任何簇
+    has_data = np.isfinite(np.diag(corr))
+    labels = _stable_labels(labels, has_data)
+    ordered = [codes[i] for i in order]
+
+    if len(codes) <= DENSE_MATRIX_MAX_INDICES:
+        matrix = pd.DataFrame(corr, index=codes, columns=codes).loc[ordered, ordered]
+        matrix.round(4).to_csv(CORRELATION_CSV, index_label="index_code")
+    else:
+        # 指数过多时完整矩阵按 N² 膨胀，只保留 Top-K 邻居
+        CORRELATION_CSV.unlink(missing_ok=True)
+    _top_neighbors(corr, codes, TOP_NEIGHBORS).to_csv(NEIGHBORS_CSV, index=False)
+
+    names = {str(cfg["code"]): cfg["name"] for cfg in indices}
+    clusters = pd.DataFrame(
+        {
+            "index_code": ordered,
+            "index_name": [names[code] for code in ordered],
+            "cluster": pd.array(labels[order], dtype="Int64"),
+            "order": np.arange(len(ordered)),
+        }
+    )
+    clusters.loc[~has_data[order], "cluster"] = pd.NA
+    clusters.to_csv(CLUSTERS_CSV, index=False)
+
+    window_end = pd.Timestamp(state["dates"][-1]).date()
+    print(f"相关性结果已写入 {DOCS_DIR}（截至 {window_end}，{clusters['cluster'].nunique()} 个簇）")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,30 @@ from __future__ import annotations
 
 import datetime as dt
 from pathlib import Path
-from typing import Optional
+from typing import Mapping, Optional
 
 import numpy as np
 import pandas as pd
 
 try:
-    from .common import DATA_ROOT, ensure_data_dir, load_indices
+    from .common import (
+        DATA_ROOT,
+        PERCENTILE_HORIZONS,
+        ensure_data_dir,
+        load_indices,
+        percentile_column,
+    )
 except ImportError:  # pragma: no cover - direct execution fallback
     import sys
 
     sys.path.append(str(Path(__file__).resolve().parent.parent))
-    from scripts.common import DATA_ROOT, ensure_data_dir, load_indices  # type: ignore
+    from scripts.common import (  # type: ignore
+        DATA_ROOT,
+        PERCENTILE_HORIZONS,
+        ensure_data_dir,
+        load_indices,
+        percentile_column,
+    )
 
 
 PRICE_DIRS = {
@@ -28,6 +40,9 @@ DJEVA_DIR = DATA_ROOT / "raw" / "djeva"
 PROCESSED_DIR = ensure_data_dir("processed")
 METRICS_FILE = PROCESSED_DIR / "metrics.csv"
 
+# Percentile metric -> valuation column
+PERCENTILE_SOURCES = {"pe": "pe", "pb": "pb", "dividend": "dividend_yield"}
+
 
 def _read_csv(path: Path) -> pd.DataFrame:
     if not path.exists():
@@ -45,15 +60,42 @@ def _ten_year_window(series: pd.Series) -> pd.Series:
     return window if not window.empty else series
 
 
-def _percentile(series: pd.Series) -> Optional[float]:
+def _horizon_percentiles(
+    series: pd.Series, horizons: Mapping[str, Optional[int]]
+) -> dict[str, Optional[float]]:
+    """Percentile of the latest value over every lookback horizon.
+
+    The series is sorted once and the observations at or below the latest value
+    are counted from the end in a single pass, so each horizon only needs a
+    binary search on the dates for its window start. Horizons longer than the
+    available history are left as ``None`` rather than repeating full history.
+    """
     series = series.dropna()
     if series.empty:
-        return None
+        return {label: None for label in horizons}
     series = series.sort_index()
-    window = _ten_year_window(series)
-    current = window.iloc[-1]
-    percentile = (window <= current).sum() / len(window) * 100.0
-    return float(np.clip(percentile, 0.0, 100.0))
+    values = series.to_numpy(dtype=float)
+    at_or_below = np.cumsum((values <= values[-1])[::-1])[::-1]
+    last_date = series.index[-1]
+
+    results: dict[str, Optional[float]] = {}
+    for label, years in horizons.items():
+        start = 0
+        if years is not None:
+            cutoff = last_date - pd.DateOffset(years=years)
+            if series.index[0] > cutoff:
+                results[label] = None
+                continue
+            start = int(series.index.searchsorted(cutoff, side="left"))
+        percentile = at_or_below[start] / (len(values) - start) * 100.0
+        results[label] = float(np.clip(percentile, 0.0, 100.0))
+    return results
+
+
+def _percentile(series: pd.Series) -> Optional[float]:
+    # 历史不足十年时退回全部历史
+    values = _horizon_percentiles(series, {"10y": 10, "all": None})
+    return values["10y"] if values["10y"] is not None else values["all"]
 
 
 def _current(series: pd.Series) -> Optional[float]:
@@ -140,6 +182,12 @@ def main() -> None:
         if pb_pct is None:
             pb_pct = _percentile(valuation.get("pb", pd.Series(dtype=float)))
 
+        horizon_pcts: dict[str, Optional[float]] = {}
+        for metric, column in PERCENTILE_SOURCES.items():
+            values = _horizon_percentiles(valuation.get(column, pd.Series(dtype=float)), PERCENTILE_HORIZONS)
+            for label, value in values.items():
+                horizon_pcts[percentile_column(metric, label)] = value
+
         drawdown = _drawdown(prices.get("close", pd.Series(dtype=float)))
 
         pe_current = _current(valuation.get("pe", pd.Series(dtype=float)))
@@ -161,6 +209,7 @@ def main() -> None:
                 "index_code": code,
                 "pe_pct": pe_pct,
                 "pb_pct": pb_pct,
+                **horizon_pcts,
                 "drawdown": drawdown,
                 "pe_current": pe_current,
                 "pb_current": pb_current,
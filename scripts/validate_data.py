@@ -0,0 +1,273 @@
+"""Validate fetched price & valuation series before metrics are computed."""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .common import DATA_ROOT, ensure_data_dir, load_indices
+except ImportError:  # pragma: no cover - direct execution fallback
+    import sys
+
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from scripts.common import DATA_ROOT, ensure_data_dir, load_indices  # type: ignore
+
+
+PRICE_DIRS = {
+    "CN_CSI": DATA_ROOT / "raw" / "cn_csi",
+    "HK_HSI": DATA_ROOT / "raw" / "hk_hsi",
+    "US_INDEX": DATA_ROOT / "raw" / "us_index",
+}
+
+DJEVA_DIR = DATA_ROOT / "raw" / "djeva"
+PROCESSED_DIR = ensure_data_dir("processed")
+REPORT_FILE = PROCESSED_DIR / "quality_report.csv"
+FLAGS_FILE = PROCESSED_DIR / "quality_flags.csv"
+
+PRICE_FIELDS = ("close",)
+VALUATION_FIELDS = ("pe", "pb", "dividend_yield")
+# 每个指数必须存在的序列，缺失时记为 missing
+REQUIRED_FIELDS = ("close", "pe")
+# 这些字段出现 <= 0 即视为脏数据（PE 允许为负）
+POSITIVE_FIELDS = ("close", "pb")
+
+# 交易日历以周一至周五近似（未区分各市场节假日）。春节、国庆休市期间
+# 最新数据距今最多约 6 个工作日（如 2024-02-08 -> 2024-02-16），
+# 滞后阈值取 7 以免长假期间 A 股序列全部误报 stale
+STALE_BUSINESS_DAYS = 7
+GAP_BUSINESS_DAYS = 10
+JUMP_ZSCORE = 8.0
+JUMP_RECENT_ROWS = 5
+MIN_COVERAGE = 0.9
+# 除滞后与缺失外，各项只对序列末尾这段交易日（或文件末尾这些行）打标，
+# 历史问题仅保留在报告中；djeva 估值文件只追加不改写，旧的坏行会一直存在
+RECENT_BUSINESS_DAYS = 60
+
+KEYS = ["index_code", "field"]
+COUNT_COLUMNS = [
+    "raw_rows",
+    "duplicates",
+    "unordered",
+    "recent_duplicates",
+    "recent_unordered",
+    "invalid",
+    "recent_invalid",
+    "rows",
+    "nonpositive",
+    "recent_nonpositive",
+    "gaps",
+    "recent_gaps",
+    "max_gap",
+    "jumps",
+    "recent_jumps",
+    "recent_rows",
+]
+
+
+def _melt_file(path: Path, code: str, fields: Iterable[str]) -> pd.DataFrame:
+    if not path.exists():
+        return pd.DataFrame()
+    df = pd.read_csv(path)
+    present = [field for field in fields if field in df.columns]
+    if "date" not in df.columns or not present:
+        return pd.DataFrame()
+    df = df[["date", *present]].copy()
+    df["row"] = np.arange(len(df))
+    frame = df.melt(id_vars=["date", "row"], value_vars=present, var_name="field", value_name="value")
+    frame["index_code"] = code
+    return frame
+
+
+def _collect_series(indices: list[dict[str, object]]) -> pd.DataFrame:
+    """Stack every series into one long frame, keeping the on-disk row order."""
+    frames: list[pd.DataFrame] = []
+    for cfg in indices:
+        code = str(cfg["code"])
+        market = cfg.get("class")
+        if market in PRICE_DIRS:
+            frames.append(_melt_file(PRICE_DIRS[market] / f"{code}_price.csv", code, PRICE_FIELDS))
+        frames.append(_melt_file(DJEVA_DIR / f"{code}_valuation.csv", code, VALUATION_FIELDS))
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=["index_code", "field", "date", "row", "value"])
+    long = pd.concat(frames, ignore_index=True)
+    long["date"] = pd.to_datetime(long["date"], errors="coerce")
+    long["value"] = pd.to_numeric(long["value"], errors="coerce")
+    return long[["index_code", "field", "date", "row", "value"]]
+
+
+def _busday_count(start, end) -> np.ndarray:
+    """Vectorised Mon-Fri business-day count; -1 where either end is missing."""
+    start_days = np.asarray(start, dtype="datetime64[D]")
+    end_days = np.broadcast_to(np.asarray(end, dtype="datetime64[D]"), start_days.shape)
+    valid = ~(np.isnat(start_days) | np.isnat(end_days))
+    counts = np.full(start_days.shape, -1, dtype=np.int64)
+    counts[valid] = np.busday_count(start_days[valid], end_days[valid])
+    return counts
+
+
+def validate(long: pd.DataFrame, as_of: pd.Timestamp) -> pd.DataFrame:
+    """Run every check over all series in one batched pass; one row per series."""
+    long = long.sort_values([*KEYS, "row"], kind="stable")
+    long["bad_date"] = long["date"].isna()
+    # 文件结构类问题（坏日期、乱序、重复、空值）按文件末尾的行数判断是否近期
+    last_row = long.groupby(KEYS, sort=False)["row"].transform("max")
+    long["recent_row"] = last_row - long["row"] < RECENT_BUSINESS_DAYS
+    long["recent_bad_date"] = long["bad_date"] & long["recent_row"]
+    raw_stats = long.groupby(KEYS).agg(
+        raw_rows=("date", "size"),
+        bad_dates=("bad_date", "sum"),
+        recent_bad_dates=("recent_bad_date", "sum"),
+    )
+    long = long.loc[~long["bad_date"]].copy()
+
+    # 文件顺序检查：日期倒退 / 重复
+    prev_date = long.groupby(KEYS, sort=False)["date"].shift()
+    long["unordered"] = long["date"] < prev_date
+    long["duplicate"] = long.duplicated(subset=[*KEYS, "date"], keep="last")
+    long["recent_unordered"] = long["unordered"] & long["recent_row"]
+    long["recent_duplicate"] = long["duplicate"] & long["recent_row"]
+
+    # 以下检查基于去重、排序后的有效观测
+    deduped = long.loc[~long["duplicate"]].copy()
+    deduped["invalid"] = deduped["value"].isna()
+    deduped["recent_invalid"] = deduped["invalid"] & deduped["recent_row"]
+    clean = deduped.dropna(subset=["value"]).sort_values([*KEYS, "date"], kind="stable")
+    clean["nonpositive"] = clean["field"].isin(POSITIVE_FIELDS) & (clean["value"] <= 0)
+
+    grouped = clean.groupby(KEYS, sort=False)
+    clean["gap"] = np.maximum(_busday_count(grouped["date"].shift(), clean["date"]), 0)
+    clean["long_gap"] = clean["gap"] > GAP_BUSINESS_DAYS
+    series_end = grouped["date"].transform("max")
+    clean["recent"] = _busday_count(clean["date"], series_end) < RECENT_BUSINESS_DAYS
+    clean["recent_gap"] = clean["long_gap"] & clean["recent"]
+    clean["recent_nonpositive"] = clean["nonpositive"] & clean["recent"]
+
+    # 对数变化的稳健 z 分数（中位数 / MAD），非正值不参与
+    series_keys = [clean["index_code"], clean["field"]]
+    log_value = np.log(clean["value"].where(clean["value"] > 0))
+    change = log_value.groupby(series_keys, sort=False).diff()
+    median = change.groupby(series_keys, sort=False).transform("median")
+    mad = (change - median).abs().groupby(series_keys, sort=False).transform("median")
+    clean["zscore"] = (change - median) / (1.4826 * mad.replace(0.0, np.nan))
+    clean["jump"] = clean["zscore"].abs() > JUMP_ZSCORE
+    clean["recent_jump"] = clean["jump"] & (grouped.cumcount(ascending=False) < JUMP_RECENT_ROWS)
+
+    order_stats = long.groupby(KEYS).agg(
+        duplicates=("duplicate", "sum"),
+        recent_duplicates=("recent_duplicate", "sum"),
+        unordered=("unordered", "sum"),
+        recent_unordered=("recent_unordered", "sum"),
+    )
+    invalid_stats = deduped.groupby(KEYS).agg(
+        invalid=("invalid", "sum"),
+        recent_invalid=("recent_invalid", "sum"),
+    )
+    value_stats = clean.groupby(KEYS).agg(
+        rows=("date", "size"),
+        first_date=("date", "min"),
+        last_date=("date", "max"),
+        last_value=("value", "last"),
+        nonpositive=("nonpositive", "sum"),
+        recent_nonpositive=("recent_nonpositive", "sum"),
+        gaps=("long_gap", "sum"),
+        recent_gaps=("recent_gap", "sum"),
+        max_gap=("gap", "max"),
+        jumps=("jump", "sum"),
+        recent_jumps=("recent_jump", "sum"),
+        recent_rows=("recent", "sum"),
+    )
+
+    report = (
+        raw_stats.join(order_stats, how="left")
+        .join(invalid_stats, how="left")
+        .join(value_stats, how="left")
+    )
+    bad_date_cols = ["bad_dates", "recent_bad_dates"]
+    report[[*COUNT_COLUMNS, *bad_date_cols]] = report[[*COUNT_COLUMNS, *bad_date_cols]].fillna(0).astype(int)
+    # 无法解析日期的行同样计入 invalid
+    report["invalid"] += report.pop("bad_dates")
+    report["recent_invalid"] += report.pop("recent_bad_dates")
+
+    expected = _busday_count(report["first_date"], report["last_date"]) + 1
+    report["coverage"] = np.where(expected > 0, report["rows"] / np.maximum(expected, 1), np.nan)
+    expected_recent = np.minimum(expected, RECENT_BUSINESS_DAYS)
+    report["recent_coverage"] = np.where(
+        expected_recent > 0, report["recent_rows"] / np.maximum(expected_recent, 1), np.nan
+    )
+    report["stale_days"] = _busday_count(report["last_date"], np.datetime64(as_of.date(), "D"))
+    return report.reset_index()
+
+
+def _flag_series(report: pd.DataFrame) -> pd.Series:
+    checks = {
+        "missing": report["rows"] == 0,
+        "stale": report["stale_days"] > STALE_BUSINESS_DAYS,
+        "jump": report["recent_jumps"] > 0,
+        "invalid": report["recent_invalid"] > 0,
+        "nonpositive": report["recent_nonpositive"] > 0,
+        "duplicate": report["recent_duplicates"] > 0,
+        "unordered": report["recent_unordered"] > 0,
+        "gap": report["recent_gaps"] > 0,
+        "coverage": report["recent_coverage"] < MIN_COVERAGE,
+    }
+    flags = pd.Series("", index=report.index)
+    for name, mask in checks.items():
+        flags = flags.where(~mask.fillna(False), flags + ";" + name)
+    return flags.str.lstrip(";")
+
+
+def _expected_series(indices: list[dict[str, object]]) -> pd.MultiIndex:
+    codes = [str(cfg["code"]) for cfg in indices]
+    return pd.MultiIndex.from_product([codes, REQUIRED_FIELDS], names=KEYS)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="校验抓取的行情与估值序列")
+    parser.add_argument("--as-of", type=str, help="校验基准日（默认今天），格式 YYYY-MM-DD")
+    args = parser.parse_args()
+    as_of = pd.Timestamp(args.as_of) if args.as_of else pd.Timestamp.today().normalize()
+
+    indices = load_indices()
+    report = validate(_collect_series(indices), as_of)
+
+    # 补齐完全缺失的必需序列
+    report = report.set_index(KEYS)
+    missing = _expected_series(indices).difference(report.index)
+    if len(missing):
+        report = pd.concat([report, pd.DataFrame(index=missing)])
+        report[COUNT_COLUMNS] = report[COUNT_COLUMNS].fillna(0).astype(int)
+        report["stale_days"] = report["stale_days"].fillna(-1).astype(int)
+    report = report.reset_index()
+
+    report["flags"] = _flag_series(report)
+    report.sort_values(KEYS).to_csv(REPORT_FILE, index=False)
+
+    labelled = report.loc[report["flags"] != ""]
+    per_index = (
+        (labelled["field"] + ":" + labelled["flags"])
+        .groupby(labelled["index_code"])
+        .agg(";".join)
+    )
+    codes = [str(cfg["code"]) for cfg in indices]
+    flags_df = pd.DataFrame({"index_code": codes})
+    flags_df["quality_flags"] = flags_df["index_code"].map(per_index).fillna("")
+    flags_df.to_csv(FLAGS_FILE, index=False)
+
+    counts = report["flags"].str.get_dummies(sep=";").sum()
+    print(f"[quality] 校验 {len(report)} 条序列，基准日 {as_of.date()}")
+    for name, count in counts.items():
+        print(f"  {name}: {int(count)}")
+    for row in flags_df.loc[flags_df["quality_flags"] != ""].itertuples():
+        print(f"  {row.index_code} -> {row.quality_flags}")
+    print(f"质量报告已生成: {REPORT_FILE}")
+
+
+if __name__ == "__main__":
+    main()